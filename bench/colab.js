@@ -0,0 +1,144 @@
+// a stand-in for the colab notebook page, built from query parameters:
+//   cells=N   number of code cells
+//   fields=N  number of form fields in the first cell, cycling through the four field types
+// running a cell whose source is "stream LINES [MS]" appends LINES lines of output, one every MS
+// milliseconds; "iframe LINES [MS]" does the same inside an output iframe; "dialog TEXT" opens a
+// paper-dialog; anything else is echoed.
+
+function shadowed(name, html, setup) {
+    customElements.define(name, class extends HTMLElement {
+        constructor() {
+            super();
+            this.attachShadow({mode: 'open'}).innerHTML = html;
+            if (setup) {
+                setup(this);
+            }
+        }
+    });
+}
+
+shadowed('colab-run-button', '<div class="cell-execution">&#9654;</div>', function(button) {
+    button.shadowRoot.querySelector('.cell-execution').addEventListener('click', function() {
+        run(button.closest('.cell'));
+    });
+});
+shadowed('paper-input', '<input>', function(paper) {
+    Object.defineProperty(paper, 'value', {
+        get: () => paper.shadowRoot.querySelector('input').value,
+        set: value => paper.shadowRoot.querySelector('input').value = value
+    });
+});
+shadowed('paper-dialog', '<div class="message"></div><paper-button aria-disabled="false">Cancel</paper-button><paper-button id="ok" aria-disabled="false">OK</paper-button>', function(dialog) {
+    dialog.shadowRoot.getElementById('ok').addEventListener('click', () => dialog.remove());
+});
+shadowed('clay-listbox', '');
+shadowed('colab-static-output-renderer', '<slot></slot>');
+
+var editors = [];
+window.monaco = {editor: {getEditors: () => editors}};
+
+var next_id = 0;
+function focus(cell) {
+    document.querySelectorAll('.cell.focused').forEach(other => other.classList.remove('focused'));
+    cell.classList.add('focused');
+}
+
+function field(index) {
+    var type = ['input', 'checkbox', 'select', 'dropdown'][index % 4];
+    var label = '<div class="formview-namelabel">field' + index + ':</div>';
+    if (type == 'input') {
+        return '<colab-form-input>' + label + '<paper-input></paper-input></colab-form-input>';
+    } else if (type == 'checkbox') {
+        return '<colab-form-input>' + label + '<input type="checkbox"></colab-form-input>';
+    } else if (type == 'select') {
+        return '<colab-form-dropdown>' + label + '<select><option>a</option><option>b</option><option>c</option></select></colab-form-dropdown>';
+    } else {
+        return '<colab-form-dropdown>' + label + '<paper-input></paper-input><paper-icon-button>&#9662;</paper-icon-button><clay-listbox></clay-listbox></colab-form-dropdown>';
+    }
+}
+
+function cell(fields) {
+    var elem = document.createElement('div');
+    elem.className = 'cell code';
+    elem.id = 'cell-' + (next_id ++);
+    var html = '<colab-run-button></colab-run-button><div class="main-content"><div class="monaco-editor"><textarea></textarea></div><div class="formview">';
+    for (var i = 0; i < fields; ++ i) {
+        html += field(i);
+    }
+    elem.innerHTML = html + '</div></div><div class="output"><colab-static-output-renderer></colab-static-output-renderer></div>';
+    customElements.upgrade(elem);
+    elem.querySelectorAll('clay-listbox').forEach(function(listbox) {
+        listbox.shadowRoot.innerHTML = '<paper-item value="x" aria-disabled="false">x</paper-item><paper-item value="y" aria-disabled="false">y</paper-item><paper-item value="z" aria-disabled="false">z</paper-item>';
+    });
+    var node = elem.querySelector('.monaco-editor'), textarea = node.querySelector('textarea');
+    editors.push({
+        getDomNode: () => node,
+        getModel: () => ({setValue: value => textarea.value = value, getValue: () => textarea.value})
+    });
+    elem.addEventListener('click', () => focus(elem));
+    return elem;
+}
+
+function complete(cell, done) {
+    var button = cell.querySelector('colab-run-button').shadowRoot;
+    var status = button.getElementById('status');
+    if (done && !status) {
+        status = document.createElement('div');
+        status.id = 'status';
+        button.appendChild(status);
+    } else if (!done && status) {
+        status.remove();
+    }
+}
+
+function emit(target, lines, ms, done) {
+    var line = 0;
+    (function tick() {
+        if (line >= lines) {
+            return done();
+        }
+        target.appendChild(document.createTextNode('line ' + (line ++) + '\n'));
+        setTimeout(tick, ms);
+    })();
+}
+
+function run(cell) {
+    var source = cell.querySelector('textarea').value.split(' ');
+    var output = cell.querySelector('.output');
+    var renderer = output.querySelector('colab-static-output-renderer');
+    output.querySelectorAll('iframe').forEach(iframe => iframe.remove());
+    renderer.textContent = '';
+    complete(cell, false);
+    var lines = parseInt(source[1]) || 0, ms = parseInt(source[2]) || 0;
+    if (source[0] == 'stream') {
+        emit(renderer, lines, ms, () => complete(cell, true));
+    } else if (source[0] == 'iframe') {
+        var iframe = document.createElement('iframe');
+        iframe.srcdoc = '<pre id="output-body"></pre>';
+        iframe.addEventListener('load', function() {
+            emit(iframe.contentDocument.getElementById('output-body'), lines, ms, () => complete(cell, true));
+        });
+        output.appendChild(iframe);
+    } else if (source[0] == 'dialog') {
+        var dialog = document.createElement('paper-dialog');
+        dialog.shadowRoot.querySelector('.message').textContent = source.slice(1).join(' ');
+        document.body.appendChild(dialog);
+        complete(cell, true);
+    } else {
+        renderer.textContent = source.join(' ');
+        complete(cell, true);
+    }
+}
+
+document.getElementById('toolbar-add-code').addEventListener('click', function() {
+    var focused = document.querySelector('.cell.focused'), inserted = cell(0);
+    var cells = document.getElementById('cells');
+    cells.insertBefore(inserted, focused ? focused.nextSibling : null);
+    focus(inserted);
+});
+
+var params = new URLSearchParams(location.search);
+var count = parseInt(params.get('cells') || '1'), fields = parseInt(params.get('fields') || '0');
+for (var i = 0; i < count; ++ i) {
+    document.getElementById('cells').appendChild(cell(i == 0 ? fields : 0));
+}
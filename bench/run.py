@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# offline benchmarks of selenium_clay against the local colab stand-in in this directory.
+# reports webdriver round trips and wall time per operation at several sizes:
+#
+#   python3 bench/run.py [--engine firefox|chrome] [--sizes 10,100,1000] [--output bench_output.txt]
+
+import argparse
+import functools
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from selenium_clay import Colab, GoogleDriver
+
+class RoundTrips:
+    # counts commands sent through a webdriver
+    def __init__(self, webdriver):
+        self.count = 0
+        execute = webdriver.execute
+        def counted(*params, **kwparams):
+            self.count += 1
+            return execute(*params, **kwparams)
+        webdriver.execute = counted
+
+def serve(dir):
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory = dir)
+    handler.log_message = lambda *params: None
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return 'http://127.0.0.1:' + str(server.server_address[1]) + '/'
+
+class Bench:
+    def __init__(self, engine, sizes):
+        self.sizes = sizes
+        self.results = []
+        self.baseurl = serve(os.path.dirname(os.path.abspath(__file__)))
+        GoogleDriver.SIGNIN_URL = self.baseurl + 'signin.html'
+        GoogleDriver.CHROME_HEADLESS = True
+        start = time.time()
+        self.googledriver = GoogleDriver(engine, tempfile.mkdtemp(prefix = 'selenium-clay-bench-'))
+        self.record('GoogleDriver.create', '', None, time.time() - start)
+        self.trips = RoundTrips(self.googledriver.webdriver)
+        self.colab = Colab(self.page(), self.googledriver)
+    def page(self, cells = 1, fields = 0):
+        return self.baseurl + 'notebook.html?cells=' + str(cells) + '&fields=' + str(fields)
+    def record(self, name, size, trips, seconds):
+        self.results.append((name, size, trips, seconds))
+        print('{:<32} {:>6} {:>8} {:>10.3f}s'.format(name, size, '-' if trips is None else trips, seconds), flush = True)
+    def measure(self, name, size, func):
+        trips = self.trips.count
+        start = time.time()
+        result = func()
+        self.record(name, size, self.trips.count - trips, time.time() - start)
+        return result
+    def set_cell_text(self):
+        for size in self.sizes:
+            self.colab.open(self.page())
+            cell = self.colab.cells[0]
+            text = ''.join(('x = ' + str(line) + '\n' for line in range(size)))
+            self.measure('SET_CELL_TEXT', size, lambda: Colab.SET_CELL_TEXT(self.colab.webdriver, cell.element, text))
+            if size == self.sizes[0]:
+                self.measure('TYPE_CELL_TEXT', size, lambda: Colab.TYPE_CELL_TEXT(self.colab.webdriver, cell.element, text))
+    def generate_cell_output(self):
+        for kind in ('stream', 'iframe'):
+            for size in self.sizes:
+                self.colab.open(self.page())
+                cell = self.colab.cells[0]
+                cell.text = kind + ' ' + str(size) + ' 1'
+                cell.run()
+                self.measure('GENERATE_CELL_OUTPUT ' + kind, size, lambda: ''.join(cell.stream))
+                cell.run()
+                self.measure('OBSERVE_CELL_OUTPUT ' + kind, size, lambda: ''.join(cell.observe()))
+    def cells(self):
+        for size in self.sizes:
+            self.colab.open(self.page(cells = size))
+            self.measure('cells text+output', size, lambda: [(cell.text, cell.output) for cell in self.colab.cells])
+            self.colab.open(self.page(cells = size))
+            def snapshot():
+                self.colab.snapshot()
+                return [(cell.text, cell.output) for cell in self.colab.cells]
+            self.measure('snapshot text+output', size, snapshot)
+            self.colab.invalidate()
+    def fields(self):
+        for size in self.sizes:
+            self.colab.open(self.page(fields = size))
+            cell = self.colab.cells[0]
+            def per_field():
+                for field in cell.fields:
+                    field.value = {'InputField': 'value', 'CheckboxField': True, 'SelectField': 'b', 'DropdownField': 'y'}[type(field).__name__]
+            self.measure('Field.value =', size, per_field)
+            self.colab.open(self.page(fields = size))
+            cell = self.colab.cells[0]
+            fields = {
+                'field' + str(index): ['value', True, 'b', 'y'][index % 4]
+                for index in range(size)
+            }
+            self.measure('Cell.set_fields', size, lambda: cell.set_fields(fields))
+    def write(self, path):
+        with open(path, 'w') as file:
+            for name, size, trips, seconds in self.results:
+                file.write('{}\t{}\t{}\t{:.6f}\n'.format(name, size, '' if trips is None else trips, seconds))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'benchmark selenium_clay against a local colab stand-in')
+    parser.add_argument('--engine', default = 'firefox', choices = ['firefox', 'chrome'])
+    parser.add_argument('--sizes', default = '10,100,1000')
+    parser.add_argument('--output', default = None, help = 'also write tab separated results here')
+    args = parser.parse_args()
+    bench = Bench(args.engine, [int(size) for size in args.sizes.split(',')])
+    try:
+        bench.set_cell_text()
+        bench.generate_cell_output()
+        bench.cells()
+        bench.fields()
+    finally:
+        bench.googledriver.quit()
+    if args.output is not None:
+        bench.write(args.output)
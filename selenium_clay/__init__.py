@@ -1,61 +1,470 @@
+import base64
+import bisect
+import collections
+import collections.abc
+import contextlib
+import copy
+import itertools
+import json
+import mimetypes
 import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
 
 import selenium
-from webdriver_setup import get_webdriver_for
-from pyshadow.main import Shadow
 
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.remote.command import Command
+from selenium.webdriver.remote.switch_to import SwitchTo
+from selenium.webdriver.remote.webelement import WebElement
 from selenium.webdriver.support import expected_conditions as EC
 
+class Wait:
+    # the one place this module waits.  polling starts fast and backs off, and the timeout is looked
+    # up by operation name: in Colab.timeouts, then GoogleDriver.timeouts, then Wait.TIMEOUTS.
+    TIMEOUTS = {
+        'SIGNIN': 10,
+        'NOTEBOOK_LOADED': 10,
+        'CLOSE_DIALOG': 10,
+        'SET_FIELD_DROPDOWN_VALUE': 10,
+        'UPLOAD_NOTEBOOK': 60,
+        'DOWNLOAD_NOTEBOOK': 60,
+        'GENERATE_CELL_OUTPUT': 60 * 60,
+    }
+    DEFAULT_TIMEOUT = 10
+    INITIAL_INTERVAL = 0.01
+    MAXIMUM_INTERVAL = 0.5
+    BACKOFF = 1.5
+    SCRIPT_SLICE = 2
+    def __init__(self, webdriver, operation, timeout = None):
+        if timeout is None:
+            timeout = getattr(webdriver, '_clay_timeouts', Wait.TIMEOUTS).get(operation, Wait.DEFAULT_TIMEOUT)
+        self.webdriver = webdriver
+        self.operation = operation
+        self.timeout = timeout
+    def until(self, condition, message = ''):
+        # like WebDriverWait.until, ignoring NoSuchElementException
+        end = time.monotonic() + self.timeout
+        interval = Wait.INITIAL_INTERVAL
+        while True:
+            try:
+                value = condition(self.webdriver)
+                if value:
+                    return value
+            except selenium.common.exceptions.NoSuchElementException:
+                pass
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise selenium.common.exceptions.TimeoutException(message or self.operation + ' timed out after ' + str(self.timeout) + 's')
+            time.sleep(min(interval, remaining))
+            interval = min(interval * Wait.BACKOFF, Wait.MAXIMUM_INTERVAL)
+    def until_script(self, script, *params):
+        # polls inside the page with the same backoff, so a short wait is one round trip.
+        # script is a function body of arguments[...] returning a truthy value when satisfied.
+        # each call polls for at most SCRIPT_SLICE seconds, within selenium's default script
+        # timeout, so the session's script timeout is left as the caller set it.
+        end = time.monotonic() + self.timeout
+        interval = Wait.INITIAL_INTERVAL
+        while True:
+            remaining = max(end - time.monotonic(), 0)
+            result = self.webdriver.execute_async_script('''
+                var done = arguments[arguments.length - 1], settings = arguments[arguments.length - 2];
+                var params = Array.prototype.slice.call(arguments, 0, -2);
+                var condition = function() {
+            ''' + script + '''
+                };
+                var end = Date.now() + settings.timeout, interval = settings.interval;
+                (function poll() {
+                    try {
+                        var value = condition.apply(null, params);
+                        if (value) {
+                            return done({value: value});
+                        }
+                    } catch (error) {
+                    }
+                    if (Date.now() >= end) {
+                        return done({interval: interval});
+                    }
+                    setTimeout(poll, Math.min(interval, end - Date.now()));
+                    interval = Math.min(interval * settings.backoff, settings.maximum);
+                })();
+            ''', *params, {'timeout': min(remaining, Wait.SCRIPT_SLICE) * 1000, 'interval': interval * 1000, 'maximum': Wait.MAXIMUM_INTERVAL * 1000, 'backoff': Wait.BACKOFF})
+            if 'value' in result:
+                return result['value']
+            if time.monotonic() >= end:
+                raise selenium.common.exceptions.TimeoutException(self.operation + ' timed out after ' + str(self.timeout) + 's')
+            interval = result['interval'] / 1000
+
 class GoogleDriver:
     DEFAULT_DIR = os.path.join('~', '.config', 'google-webdriver')
+    SIGNIN_URL = 'https://accounts.google.com/'
+    CHROME_HEADLESS = False
     SIGNINGIN_ELEMENT_IDS = ['captchaimg', 'gaia_loginform']
     SIGNEDIN_ELEMENT_IDS = ['wiz_jd']
+    LOGIN_COOKIE_NAMES = ['SID', 'HSID', 'SSID', '__Secure-1PSID', '__Secure-3PSID']
+    LOGIN_RECORD = 'selenium-clay-login.json'
+    LOGIN_RECHECK_SECONDS = 24 * 60 * 60
+    DRIVER_RECORD = 'selenium-clay-driver.json'
+    profiler = None
     def _id_exists(ids):
         def ec(webdriver):
             return any((webdriver.find_elements_by_id(id) for id in ids))
         return ec
-    def __init__(self, engine = 'firefox', dir = None):
+    def __init__(self, engine = 'firefox', dir = None, timeouts = None, driver_path = None):
+        # timeouts maps Wait operation names to seconds, overriding Wait.TIMEOUTS.
+        # driver_path pins the geckodriver or chromedriver binary, skipping driver discovery.
+        self.timeouts = dict(timeouts or {})
+        self.driver_path = driver_path
         if dir is None:
             dir = GoogleDriver.DEFAULT_DIR
         dir = os.path.expanduser(dir)
         self.engine = engine
         self.dir = os.path.join(dir, self.engine, '')
+        self._tabs_lock = threading.RLock()
+        self.downloads = None
         self.create()
     def create(self):
         os.makedirs(self.dir, exist_ok=True)
+        # the tab the browser last switched to, and this driver's own window once it has tabs
+        self._tab = None
+        self.handle = None
+        # downloads are saved here without prompting.  one directory is kept across create()s and removed by quit().
+        if self.downloads is None or not os.path.isdir(self.downloads):
+            self.downloads = tempfile.mkdtemp(prefix = 'google-webdriver-downloads-')
+        if self.engine == 'firefox':
+            options = selenium.webdriver.FirefoxOptions()
+            options.profile = self.dir
+            options.headless = True
+            #ff_options.add_argument('--headless')
+            options.set_preference('browser.download.folderList', 2)
+            options.set_preference('browser.download.dir', self.downloads)
+            options.set_preference('browser.helperApps.neverAsk.saveToDisk', 'application/x-ipynb+json,application/json,application/octet-stream')
+            self.webdriver = self._start(selenium.webdriver.Firefox, options)
+        elif self.engine == 'chrome':
+            options = selenium.webdriver.ChromeOptions()
+            options.add_argument('--user-data-dir=' + self.dir)
+            #options.add_argument('--enable-logging')
+            options.headless = GoogleDriver.CHROME_HEADLESS
+            options.add_experimental_option('prefs', {'download.default_directory': self.downloads, 'download.prompt_for_download': False})
+            self.webdriver = self._start(selenium.webdriver.Chrome, options)
+        else:
+            raise Exception('unimplemented engine:', self.engine)
+        self.webdriver._clay_timeouts = collections.ChainMap(self.timeouts, Wait.TIMEOUTS)
+        if self.profiler is not None:
+            self.profiler.attach(self.webdriver)
+        # a recently verified login is trusted; pages that redirect to sign-in call verify() themselves
+        self.verified = self.login_is_cached()
+        if not self.verified:
+            self.verify()
+        return self.webdriver
+    def _start(self, driver_class, options):
+        # a pinned driver binary, or the one webdriver_setup found on an earlier start, is run directly
+        path = self.driver_path
+        if path is None:
+            path = self._cached_driver_path()
+        if path is not None:
+            try:
+                return driver_class(executable_path = path, options = options)
+            except selenium.common.exceptions.WebDriverException:
+                if self.driver_path is not None:
+                    raise
+                # e.g. the browser was upgraded past the cached driver
+                self._forget_driver_path()
+        from webdriver_setup import get_webdriver_for
+        webdriver = get_webdriver_for(self.engine, options=options)
+        path = getattr(getattr(webdriver, 'service', None), 'path', None)
+        if path is not None:
+            with open(os.path.join(self.dir, GoogleDriver.DRIVER_RECORD), 'w') as file:
+                json.dump({'path': os.path.abspath(path)}, file)
+        return webdriver
+    def _cached_driver_path(self):
         try:
-            if self.engine == 'firefox':
-                options = selenium.webdriver.FirefoxOptions()
-                options.profile = self.dir
-                options.headless = True
-                #ff_options.add_argument('--headless')
-                self.webdriver = get_webdriver_for('firefox', options=options)
-                self.webdriver.get('https://accounts.google.com/')
-                WebDriverWait(self.webdriver, 10).until(GoogleDriver._id_exists(GoogleDriver.SIGNINGIN_ELEMENT_IDS + GoogleDriver.SIGNEDIN_ELEMENT_IDS))
-                if GoogleDriver._id_exists(GoogleDriver.SIGNINGIN_ELEMENT_IDS)(self.webdriver):
-                    # not logged in
-                    raise Exception('Not logged in.  Please run this, login, exit, and try again: XRE_PROFILE_PATH="' + self.dir + '" firefox https://accounts.google.com')
-            elif self.engine == 'chrome':
-                options = selenium.webdriver.ChromeOptions()
-                options.add_argument('--user-data-dir=' + self.dir)
-                #options.add_argument('--enable-logging')
-                #options.headless = True
-                self.webdriver = get_webdriver_for('chrome', options=options)
-                self.webdriver.get('https://accounts.google.com/')
-                WebDriverWait(self.webdriver, 10).until(GoogleDriver._id_exists(GoogleDriver.SIGNINGIN_ELEMENT_IDS + GoogleDriver.SIGNEDIN_ELEMENT_IDS))
-                if GoogleDriver._id_exists(GoogleDriver.SIGNINGIN_ELEMENT_IDS)(self.webdriver):
-                    # not logged in
-                    raise Exception('Not logged in.  Please run this or similar, login, exit, and try again: google-chrome --user-data-dir="' + self.dir + '" https://accounts.google.com')
-            else:
-                raise Exception('unimplemented engine:', engine)
+            with open(os.path.join(self.dir, GoogleDriver.DRIVER_RECORD)) as file:
+                path = json.load(file)['path']
+        except (OSError, ValueError, KeyError):
+            return None
+        return path if os.path.exists(path) else None
+    def _forget_driver_path(self):
+        try:
+            os.remove(os.path.join(self.dir, GoogleDriver.DRIVER_RECORD))
+        except OSError:
+            pass
+    def verify(self):
+        # checks the login at accounts.google.com and records the result
+        try:
+            self.webdriver.get(GoogleDriver.SIGNIN_URL)
+            Wait(self.webdriver, 'SIGNIN').until(GoogleDriver._id_exists(GoogleDriver.SIGNINGIN_ELEMENT_IDS + GoogleDriver.SIGNEDIN_ELEMENT_IDS))
         except selenium.common.exceptions.TimeoutException:
             print(self.webdriver.execute_script('return Array.prototype.map.call(document.querySelectorAll("*[id]"), x=>x.id)'))
             raise Exception("element ids unrecognised, please update SIGNINGIN_ELEMENT_IDS and SIGNEDIN_ELEMENT_IDS in source code to reflect element ids that indicate needing to sign or, or being signed in, at https://accounts.google.com/ .  Ids in a page can be found in the developer console in a web browser using hardcoded element ids in source code using: console.log(JSON.stringify(Array.prototype.map.call(document.querySelectorAll('*[id]'), x=>x.id))).  Here's the current list: " + self.webdriver.execute_script('return Array.prototype.map.call(document.querySelectorAll("*[id]"), x=>x.id)'))
+        if GoogleDriver._id_exists(GoogleDriver.SIGNINGIN_ELEMENT_IDS)(self.webdriver):
+            # not logged in
+            self.forget_login()
+            if self.engine == 'firefox':
+                raise Exception('Not logged in.  Please run this, login, exit, and try again: XRE_PROFILE_PATH="' + self.dir + '" firefox https://accounts.google.com')
+            else:
+                raise Exception('Not logged in.  Please run this or similar, login, exit, and try again: google-chrome --user-data-dir="' + self.dir + '" https://accounts.google.com')
+        self.remember_login()
+        self.verified = True
+    def is_signin_url(self, url):
+        return url.startswith(GoogleDriver.SIGNIN_URL)
+    def _login_path(self):
+        return os.path.join(self.dir, GoogleDriver.LOGIN_RECORD)
+    def login_is_cached(self):
+        try:
+            with open(self._login_path()) as file:
+                record = json.load(file)
+        except (OSError, ValueError):
+            return False
+        now = time.time()
+        if record.get('expiry') is not None and record['expiry'] <= now:
+            return False
+        return now - record.get('verified', 0) < GoogleDriver.LOGIN_RECHECK_SECONDS
+    def remember_login(self):
+        expiries = [
+            cookie['expiry']
+            for cookie in self.webdriver.get_cookies()
+            if cookie['name'] in GoogleDriver.LOGIN_COOKIE_NAMES and 'expiry' in cookie
+        ]
+        with open(self._login_path(), 'w') as file:
+            json.dump({'verified': time.time(), 'expiry': min(expiries) if expiries else None}, file)
+    def forget_login(self):
+        try:
+            os.remove(self._login_path())
+        except OSError:
+            pass
+    def is_alive(self):
+        try:
+            self.webdriver.current_url
+            return True
+        except Exception:
+            return False
+    def quit(self):
+        try:
+            self.webdriver.quit()
+        except Exception:
+            pass
+        if self.downloads is not None:
+            shutil.rmtree(self.downloads, ignore_errors = True)
+            self.downloads = None
+    def tab(self):
+        # a new window of this browser, to host another Colab without starting another browser
+        return GoogleDriverTab(self)
+    def _share(self, owner, webdriver):
+        # makes webdriver switch to owner's window and frames before each of its commands
+        execute = webdriver.execute
+        def shared_execute(command, params = None):
+            with self._tabs_lock:
+                if self._tab is not owner:
+                    execute(Command.SWITCH_TO_WINDOW, {'handle': owner.handle} if webdriver.w3c else {'name': owner.handle})
+                    self._tab = owner
+                    if command != Command.SWITCH_TO_FRAME or params['id'] is not None:
+                        try:
+                            for frame in owner._frames:
+                                execute(Command.SWITCH_TO_FRAME, {'id': frame})
+                        except Exception:
+                            # e.g. colab replaced the frame while another tab was active.  the tab is
+                            # left at its window's top level so only this command fails.
+                            owner._frames = []
+                            self._tab = None
+                            raise
+                result = execute(command, params)
+                if command == Command.SWITCH_TO_FRAME:
+                    if params['id'] is None:
+                        owner._frames = []
+                    else:
+                        owner._frames.append(params['id'])
+                elif command == Command.SWITCH_TO_PARENT_FRAME:
+                    owner._frames = owner._frames[:-1]
+                elif command == Command.SWITCH_TO_WINDOW:
+                    # the window was changed by hand; switch back on the next command
+                    self._tab = None
+                return result
+        webdriver.execute = shared_execute
+
+class GoogleDriverTab(GoogleDriver):
+    # one window of a host GoogleDriver's browser.  commands from all tabs of a host are serialized,
+    # and each tab switches back to its own window and frame before sending its own commands, so
+    # frame switches like TO_CELL_OUTPUT's stay correct when tabs interleave.
+    def __init__(self, host):
+        self.host = host
+        self.engine = host.engine
+        self.dir = host.dir
+        self.timeouts = host.timeouts
+        self.driver_path = host.driver_path
+        self.handle = None
+        self.create()
+    def tab(self):
+        # a sibling tab of the same host
+        return self.host.tab()
+    def create(self):
+        if self.handle is not None:
+            self.quit()
+        host = self.host
+        if not host.is_alive():
+            host.create()
+        with host._tabs_lock:
+            if host.handle is None:
+                # from now on the host's own window takes turns with its tabs too
+                host.handle = host.webdriver.current_window_handle
+                host._frames = []
+                host._tab = host
+                host._share(host, host.webdriver)
+            handles = host.webdriver.window_handles
+            host.webdriver.execute_script('window.open()')
+            self.handle = [handle for handle in host.webdriver.window_handles if handle not in handles][0]
+            self._frames = []
+            webdriver = copy.copy(host.webdriver)
+            # the copy shares the browser session but must create its elements and switch_to itself
+            webdriver.__dict__.pop('execute', None)
+            webdriver.__dict__.pop('_clay_profiler', None)
+            webdriver._switch_to = SwitchTo(webdriver)
+            host._share(self, webdriver)
+        self.webdriver = webdriver
+        self.downloads = host.downloads
+        self.verified = host.verified
+        self.profiler = host.profiler
+        if self.profiler is not None:
+            self.profiler.attach(self.webdriver)
         return self.webdriver
+    def quit(self):
+        # closes only this tab's window
+        try:
+            with self.host._tabs_lock:
+                self.webdriver.execute(Command.CLOSE)
+                self.host._tab = None
+        except Exception:
+            pass
+        self.handle = None
+
+class GoogleDriverPool:
+    # keeps size signed-in sessions per engine ready for checkout.
+    # sessions are health-checked on checkout and recycled after max_uses checkouts.
+    # chrome locks its user data dir, so additional chrome sessions run on temporary copies of the profile.
+    def __init__(self, size = 1, engines = ('firefox',), dir = None, max_uses = None):
+        if dir is None:
+            dir = GoogleDriver.DEFAULT_DIR
+        self.dir = os.path.expanduser(dir)
+        self.size = size
+        self.engines = list(engines)
+        self.max_uses = max_uses
+        self._condition = threading.Condition()
+        self._idle = {engine: [] for engine in self.engines}
+        self._live = {engine: 0 for engine in self.engines}
+        self._uses = {}
+        self._copies = {}
+        self._closed = False
+        try:
+            self.warm()
+        except:
+            # the caller never gets the pool, so shut down the sessions that did start
+            self.close()
+            raise
+    def _create(self, engine, index):
+        if engine == 'chrome' and index > 0:
+            copy = tempfile.mkdtemp(prefix = 'google-webdriver-')
+            shutil.copytree(os.path.join(self.dir, engine), os.path.join(copy, engine), ignore = shutil.ignore_patterns('Singleton*'))
+            googledriver = GoogleDriver(engine, copy)
+            self._copies[googledriver] = copy
+        else:
+            googledriver = GoogleDriver(engine, self.dir)
+        self._uses[googledriver] = 0
+        return googledriver
+    def _destroy(self, googledriver):
+        googledriver.quit()
+        self._uses.pop(googledriver, None)
+        copy = self._copies.pop(googledriver, None)
+        if copy is not None:
+            shutil.rmtree(copy, ignore_errors = True)
+    def warm(self):
+        # creates sessions in parallel until each engine has size of them
+        with self._condition:
+            pending = []
+            for engine in self.engines:
+                while self._live[engine] < self.size:
+                    pending.append((engine, self._live[engine]))
+                    self._live[engine] += 1
+        created = []
+        errors = []
+        def start(engine, index):
+            try:
+                created.append((engine, self._create(engine, index)))
+            except Exception as exception:
+                errors.append(exception)
+        threads = [
+            threading.Thread(target = start, args = item)
+            for item in pending
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with self._condition:
+            for engine in self.engines:
+                self._live[engine] -= len([item for item in pending if item[0] == engine])
+            for engine, googledriver in created:
+                self._live[engine] += 1
+                self._idle[engine].append(googledriver)
+            self._condition.notify_all()
+        if errors:
+            raise Exception('failed to start ' + str(len(errors)) + ' of ' + str(len(pending)) + ' pooled sessions') from errors[0]
+    # health checks and shutdowns are browser round trips, so they are made without holding _condition
+    def checkout(self, engine = None, timeout = None):
+        if engine is None:
+            engine = self.engines[0]
+        while True:
+            with self._condition:
+                while not self._idle[engine] and self._live[engine] >= self.size:
+                    if not self._condition.wait(timeout):
+                        raise Exception('no pooled ' + engine + ' session available')
+                if not self._idle[engine]:
+                    index = self._live[engine]
+                    self._live[engine] += 1
+                    break
+                googledriver = self._idle[engine].pop()
+            if googledriver.is_alive():
+                with self._condition:
+                    self._uses[googledriver] += 1
+                return googledriver
+            self.discard(googledriver)
+        try:
+            googledriver = self._create(engine, index)
+        except:
+            with self._condition:
+                self._live[engine] -= 1
+                self._condition.notify_all()
+            raise
+        with self._condition:
+            self._uses[googledriver] += 1
+        return googledriver
+    def checkin(self, googledriver):
+        # sessions checked in after close() are shut down
+        if self._closed or self.max_uses is not None and self._uses.get(googledriver, 0) >= self.max_uses or not googledriver.is_alive():
+            self.discard(googledriver)
+            return
+        with self._condition:
+            self._idle[googledriver.engine].append(googledriver)
+            self._condition.notify_all()
+    def discard(self, googledriver):
+        self._destroy(googledriver)
+        with self._condition:
+            self._live[googledriver.engine] -= 1
+            self._condition.notify_all()
+    def close(self):
+        with self._condition:
+            self._closed = True
+            idle = [googledriver for googledrivers in self._idle.values() for googledriver in googledrivers]
+            for googledrivers in self._idle.values():
+                googledrivers.clear()
+        for googledriver in idle:
+            self.discard(googledriver)
 
 class GoogleDriverChrome(GoogleDriver):
     def __init__(self, dir = GoogleDriver.DEFAULT_DIR):
@@ -65,6 +474,103 @@ class GoogleDriverFirefox(GoogleDriver):
     def __init__(self, dir = GoogleDriver.DEFAULT_DIR):
         super().__init__('firefox', dir)
         
+class ShadowCache:
+    # stands in for pyshadow's Shadow in the Colab helpers.  a small deep query function is injected
+    # once per page rather than with every lookup, and single element lookups are cached by
+    # (parent, selector) as CachedElements that re-resolve themselves when they go stale.
+    ENABLED = True
+    _MISSING = '__clay_missing__'
+    _INJECT_JS = '''
+        window.__clay_deep = function(root, selector, all) {
+            var found = [];
+            function visit(node) {
+                var matches = node.querySelectorAll(selector);
+                for (var i = 0; i < matches.length; ++ i) {
+                    found.push(matches[i]);
+                    if (!all) {
+                        return true;
+                    }
+                }
+                var children = node.querySelectorAll('*');
+                for (var i = 0; i < children.length; ++ i) {
+                    if (children[i].shadowRoot && visit(children[i].shadowRoot)) {
+                        return true;
+                    }
+                }
+                return false;
+            }
+            if (root.shadowRoot) {
+                visit(root.shadowRoot);
+            }
+            if (all || !found.length) {
+                visit(root);
+            }
+            return all ? found : (found.length ? found[0] : null);
+        };
+    '''
+    _QUERY_JS = 'return window.__clay_deep ? window.__clay_deep(arguments[0] || document, arguments[1], arguments[2]) : "' + _MISSING + '";'
+    def __init__(self, webdriver, enabled = None):
+        if enabled is None:
+            enabled = ShadowCache.ENABLED
+        self.webdriver = webdriver
+        self.enabled = enabled
+        self._elements = {}
+    def _query(self, parent, selector, all):
+        result = self.webdriver.execute_script(ShadowCache._QUERY_JS, parent, selector, all)
+        if result == ShadowCache._MISSING:
+            # new page: inject the helper and retry
+            self.webdriver.execute_script(ShadowCache._INJECT_JS)
+            result = self.webdriver.execute_script(ShadowCache._QUERY_JS, parent, selector, all)
+        return result
+    def find_element(self, parent, selector = None):
+        if selector is None:
+            parent, selector = None, parent
+        key = (None if parent is None else parent.id, selector)
+        if self.enabled and key in self._elements:
+            return self._elements[key]
+        found = self._query(parent, selector, False)
+        if found is None:
+            raise selenium.common.exceptions.NoSuchElementException('Element with CSS ' + selector + ' not found')
+        if not self.enabled:
+            return found
+        element = CachedElement(self, parent, selector, found)
+        self._elements[key] = element
+        return element
+    def find_elements(self, parent, selector = None):
+        if selector is None:
+            parent, selector = None, parent
+        return self._query(parent, selector, True)
+    def forget(self, element):
+        self._elements = {
+            key: cached
+            for key, cached in self._elements.items()
+            if cached is not element
+        }
+    def clear(self):
+        self._elements = {}
+
+class CachedElement(WebElement):
+    # a WebElement that looks itself up again when its reference goes stale
+    def __init__(self, cache, lookup_parent, selector, element):
+        super().__init__(element.parent, element.id)
+        self.__dict__.update(element.__dict__)
+        self._cache = cache
+        self._lookup_parent = lookup_parent
+        self._selector = selector
+    def _execute(self, command, params = None):
+        try:
+            return super()._execute(command, params)
+        except selenium.common.exceptions.StaleElementReferenceException:
+            try:
+                found = self._cache._query(self._lookup_parent, self._selector, False)
+            except selenium.common.exceptions.StaleElementReferenceException:
+                found = None
+            if found is None:
+                self._cache.forget(self)
+                raise
+            self._id = found.id
+            return super()._execute(command, params)
+
 class Colab:
     # these are collected here to make them easy to update
     def BASEURL():
@@ -88,6 +594,130 @@ class Colab:
     def CELL_ELEMENTS(webdriver):
         return webdriver.find_elements_by_class_name('cell')
 
+    def CELL_IDS(webdriver):
+        return webdriver.execute_script('''
+            return Array.prototype.map.call(document.getElementsByClassName('cell'), cell => cell.id);
+        ''')
+
+    def IS_CODE_CELL(cell_element):
+        # text cells have no run button
+        return 'code' in cell_element.get_attribute('class').split()
+
+    def CELL_COUNT(webdriver):
+        return webdriver.execute_script('''
+            return document.getElementsByClassName('cell').length;
+        ''')
+
+    def CELL_ELEMENTS_BY_ID(webdriver, ids):
+        return webdriver.execute_script('''
+            return arguments[0].map(id => document.getElementById(id));
+        ''', ids)
+
+    def FOCUSED_CELL(webdriver):
+        # the id, position and element of the focused cell, which is where insertions land
+        return webdriver.execute_script('''
+            var cells = document.getElementsByClassName('cell');
+            for (var index = 0; index < cells.length; ++ index) {
+                if (cells[index].classList.contains('focused')) {
+                    return {id: cells[index].id, index: index, element: cells[index]};
+                }
+            }
+            return null;
+        ''')
+
+    # defines deep(root, selector): querySelector that also searches nested shadow roots
+    _DEEP_JS = '''
+        function deep(root, selector) {
+            var found = root.querySelector(selector);
+            if (found) {
+                return found;
+            }
+            var all = root.querySelectorAll('*');
+            for (var i = 0; i < all.length; ++ i) {
+                if (all[i].shadowRoot) {
+                    found = deep(all[i].shadowRoot, selector);
+                    if (found) {
+                        return found;
+                    }
+                }
+            }
+            return null;
+        }
+    '''
+
+    # defines field(elem): the name, type and value of a colab-form-input or colab-form-dropdown, as GET_FIELD_TYPE classifies it
+    _FIELD_JS = '''
+        function field(elem) {
+            var label = elem.querySelector('.formview-namelabel');
+            var name = label ? label.innerText : '';
+            if (name.slice(-1) == ':') {
+                name = name.slice(0, -1);
+            }
+            var type = null, value = null, tag = elem.tagName.toLowerCase();
+            if (tag == 'colab-form-input') {
+                var input = elem.querySelector('input');
+                if (elem.querySelector('paper-input')) {
+                    type = 'INPUT';
+                    input = deep(elem, 'input');
+                    value = input ? input.value : null;
+                } else if (input && input.type == 'checkbox') {
+                    type = 'CHECKBOX';
+                    value = input.checked;
+                }
+            } else if (tag == 'colab-form-dropdown') {
+                var select = elem.querySelector('select');
+                if (select) {
+                    type = 'SELECT';
+                    value = select.value;
+                } else if (elem.querySelector('paper-input')) {
+                    type = 'DROPDOWN';
+                    var input = deep(elem, 'input');
+                    value = input ? input.value : null;
+                }
+            }
+            return {element: elem, name: name, type: type, value: value};
+        }
+    '''
+
+    def SNAPSHOT_CELLS(webdriver):
+        # gathers the state of every cell in a single script call.
+        # output and imgs are null for cells whose output is in a cross-origin iframe.
+        return webdriver.execute_script(Colab._DEEP_JS + Colab._FIELD_JS + '''
+            var editors = (window.monaco && monaco.editor && monaco.editor.getEditors) ? monaco.editor.getEditors() : [];
+            function text(cell) {
+                for (var i = 0; i < editors.length; ++ i) {
+                    var node = editors[i].getDomNode();
+                    if (node && cell.contains(node)) {
+                        return editors[i].getModel().getValue();
+                    }
+                }
+                var textarea = cell.querySelector('textarea');
+                if (textarea) {
+                    return textarea.value;
+                }
+                var content = cell.querySelector('.main-content');
+                return content ? content.innerText : null;
+            }
+            return Array.prototype.map.call(document.getElementsByClassName('cell'), function(cell) {
+                var output = cell.querySelector('.output'), rendered = null, imgs = null;
+                if (output && !output.querySelector('iframe')) {
+                    var renderer = output.querySelector('colab-static-output-renderer') || output;
+                    rendered = renderer.innerText;
+                    imgs = Array.prototype.map.call(renderer.getElementsByTagName('img'), img => img.src);
+                }
+                var button = cell.querySelector('colab-run-button');
+                return {
+                    element: cell,
+                    id: cell.id,
+                    text: text(cell),
+                    output: rendered,
+                    imgs: imgs,
+                    complete: button ? Boolean(deep(button, '#status')) : null,
+                    fields: Array.prototype.map.call(cell.querySelectorAll('colab-form-input,colab-form-dropdown'), field)
+                };
+            });
+        ''')
+
     def FIELD_ELEMENTS(cell_element):
         return cell_element.find_elements_by_css_selector('colab-form-input,colab-form-dropdown')
 
@@ -96,12 +726,12 @@ class Colab:
 
     def RUN_CELL(webdriver, shadow, cell_element):
         cell_element.click()
-        outer = cell_element.find_element_by_tag_name('colab-run-button')
+        outer = shadow.find_element(cell_element, 'colab-run-button')
         inner = shadow.find_element(outer, '.cell-execution')
         inner.click()
 
     def IS_RUN_COMPLETE(webdriver, shadow, cell_element):
-        outer = cell_element.find_element_by_tag_name('colab-run-button')
+        outer = shadow.find_element(cell_element, 'colab-run-button')
         # div id status
         return bool(shadow.find_elements(outer, '#status'))
 
@@ -135,37 +765,295 @@ class Colab:
 
     def GET_CELL_IMGS(webdriver, cell_element):
         def elem2imgs(elem):
-            return [
-                img.get_attribute('src')
-                for img in elem.find_elements_by_tag_name('img')
-            ]
+            return webdriver.execute_script('''
+                return Array.prototype.map.call(arguments[0].getElementsByTagName('img'), img => img.src);
+            ''', elem)
         return Colab.TO_CELL_OUTPUT(webdriver, cell_element, elem2imgs)
 
+    def GET_CELL_IMAGES(webdriver, cell_element, known_digests):
+        # all output images in one call, as {digest, mime, base64, payload} with the payload split
+        # from its data uri and digest the sha-256 of the image bytes.  images whose digest is known
+        # come back as just {digest}, and images that can't be read as {error}.
+        # non-data srcs are fetched and converted in the page.  digests are cached per img element.
+        def elem2images(elem):
+            return webdriver.execute_async_script('''
+                var root = arguments[0], known = new Set(arguments[1]), done = arguments[arguments.length - 1];
+                function split(uri) {
+                    var comma = uri.indexOf(','), header = uri.slice(5, comma);
+                    return {mime: header.split(';')[0], base64: header.endsWith(';base64'), payload: uri.slice(comma + 1)};
+                }
+                function bytes(image) {
+                    if (image.base64) {
+                        return Uint8Array.from(atob(image.payload), char => char.charCodeAt(0));
+                    }
+                    // percent-decoded utf-8, as urllib.parse.unquote_to_bytes decodes it
+                    var encoded = new TextEncoder().encode(image.payload), decoded = [];
+                    for (var i = 0; i < encoded.length; ++ i) {
+                        var hex = String.fromCharCode(encoded[i + 1], encoded[i + 2]);
+                        if (encoded[i] == 37 && /^[0-9a-fA-F]{2}$/.test(hex)) {
+                            decoded.push(parseInt(hex, 16));
+                            i += 2;
+                        } else {
+                            decoded.push(encoded[i]);
+                        }
+                    }
+                    return Uint8Array.from(decoded);
+                }
+                function uri(img) {
+                    if (img.src.startsWith('data:')) {
+                        return Promise.resolve(img.src);
+                    }
+                    return fetch(img.src).then(response => response.blob()).then(blob => new Promise(function(resolve, reject) {
+                        var reader = new FileReader();
+                        reader.onload = () => resolve(reader.result);
+                        reader.onerror = () => reject(reader.error);
+                        reader.readAsDataURL(blob);
+                    }));
+                }
+                Promise.all(Array.prototype.map.call(root.getElementsByTagName('img'), function(img) {
+                    var src = img.src;
+                    if (img.__clay_src === src && known.has(img.__clay_digest)) {
+                        return {digest: img.__clay_digest};
+                    }
+                    var image;
+                    return uri(img).then(function(data) {
+                        image = split(data);
+                        return crypto.subtle.digest('SHA-256', bytes(image));
+                    }).then(function(hash) {
+                        image.digest = Array.from(new Uint8Array(hash), byte => byte.toString(16).padStart(2, '0')).join('');
+                        img.__clay_src = src;
+                        img.__clay_digest = image.digest;
+                        return known.has(image.digest) ? {digest: image.digest} : image;
+                    }).catch(error => ({error: String(error)}));
+                })).then(done, error => done({error: String(error)}));
+            ''', elem, list(known_digests))
+        images = Colab.TO_CELL_OUTPUT(webdriver, cell_element, elem2images)
+        if isinstance(images, dict):
+            raise Exception('could not read output images: ' + images['error'])
+        return images
+
     def GENERATE_CELL_OUTPUT(webdriver, shadow, cell_element):
-        last_output = None
+        reader = Colab.OutputReader(webdriver, cell_element)
         next_output = None
         def output_changed(webdriver):
-            nonlocal last_output, next_output
-            next_output = Colab.GET_CELL_OUTPUT(webdriver, cell_element)   
+            nonlocal next_output
+            next_output = reader.read()
             dialog_title = Colab.DIALOG_MESSAGE(webdriver, shadow)
-            if next_output != last_output or Colab.IS_RUN_COMPLETE(webdriver, shadow, cell_element):
+            if next_output or Colab.IS_RUN_COMPLETE(webdriver, shadow, cell_element):
                 return True
             elif dialog_title is not None:
                 Colab.CLOSE_DIALOG(webdriver, shadow)
-                next_output = last_output + dialog_title
+                next_output += dialog_title
                 return True
             else:
                 return False
         output_changed(webdriver)
         yield next_output
-        last_output = next_output
         while not Colab.IS_RUN_COMPLETE(webdriver, shadow, cell_element):
-            WebDriverWait(webdriver, 60*60).until(output_changed)
-            commonprefix = os.path.commonprefix((next_output, last_output))
-            yield next_output[len(commonprefix):]
-            last_output = next_output
+            Wait(webdriver, 'GENERATE_CELL_OUTPUT').until(output_changed)
+            yield next_output
+
+    # defines read(node, offset, tail): the text added to node since the last read, continuing after
+    # offset when node is a replacement whose text still ends at offset with tail
+    _READ_JS = '''
+        function read(node, offset, tail) {
+            if (!node) {
+                return {chunk: '', offset: offset, tail: tail};
+            }
+            var text = node.innerText, start = 0;
+            var continues = offset >= tail.length && offset <= text.length && text.slice(offset - tail.length, offset) == tail;
+            if (text.length < offset) {
+                // shorter than what was read: cleared for a new run, so read it all
+                start = 0;
+            } else if (node.__clay_text !== undefined && !continues) {
+                // rewritten in place: continue after what it still shares with the last read
+                var old = node.__clay_text, length = Math.min(old.length, text.length);
+                while (start < length && old.charCodeAt(start) == text.charCodeAt(start)) {
+                    ++ start;
+                }
+            } else if (continues) {
+                start = offset;
+            }
+            node.__clay_text = text;
+            return {chunk: text.slice(start), offset: text.length, tail: text.slice(-64)};
+        }
+    '''
+
+    def PASTE_CELL_TEXT(webdriver, cell_element, text):
+        # sets the whole source through the editor model in one call, bypassing auto-indent.
+        # returns the resulting source, or None if no editor model could be found.
+        return webdriver.execute_script('''
+            var cell = arguments[0], text = arguments[1];
+            if (!window.monaco || !monaco.editor || !monaco.editor.getEditors) {
+                return null;
+            }
+            var editors = monaco.editor.getEditors();
+            for (var i = 0; i < editors.length; ++ i) {
+                var node = editors[i].getDomNode();
+                if (node && cell.contains(node)) {
+                    var model = editors[i].getModel();
+                    model.setValue(text);
+                    return model.getValue();
+                }
+            }
+            return null;
+        ''', cell_element, text)
+
+    # defines drain(node): installs a MutationObserver on node on first use, buffering
+    # appended text in the page, and returns and clears what was buffered since the last call,
+    # and release(node): disconnects the observer and drops its buffer
+    _DRAIN_JS = '''
+        function added_text(added) {
+            // rendered text, as Cell.output reads it
+            if (added.nodeType == Node.TEXT_NODE) {
+                return added.data;
+            } else if (added.nodeType != Node.ELEMENT_NODE || added.tagName == 'STYLE' || added.tagName == 'SCRIPT') {
+                return '';
+            }
+            return added.innerText;
+        }
+        function drain(node) {
+            if (!node.__clay_observer) {
+                var seen = new WeakMap();
+                node.__clay_chunks = [node.innerText];
+                node.__clay_collect = function(mutations) {
+                    mutations.forEach(function(mutation) {
+                        if (mutation.type == 'characterData') {
+                            var data = mutation.target.data;
+                            var start = seen.has(mutation.target) ? seen.get(mutation.target) : (mutation.oldValue || '').length;
+                            if (data.length >= start) {
+                                node.__clay_chunks.push(data.slice(start));
+                            } else {
+                                node.__clay_chunks.push(data);
+                            }
+                            seen.set(mutation.target, data.length);
+                        } else {
+                            mutation.addedNodes.forEach(function(added) {
+                                node.__clay_chunks.push(added_text(added));
+                                if (added.nodeType == Node.TEXT_NODE) {
+                                    seen.set(added, added.data.length);
+                                }
+                            });
+                        }
+                    });
+                };
+                node.__clay_observer = new MutationObserver(node.__clay_collect);
+                node.__clay_observer.observe(node, {childList: true, subtree: true, characterData: true, characterDataOldValue: true});
+            }
+            // records not yet delivered to the callback
+            node.__clay_collect(node.__clay_observer.takeRecords());
+            var chunks = node.__clay_chunks;
+            node.__clay_chunks = [];
+            return chunks.join('');
+        }
+        function release(node) {
+            if (node && node.__clay_observer) {
+                node.__clay_observer.disconnect();
+                delete node.__clay_observer;
+                delete node.__clay_collect;
+                delete node.__clay_chunks;
+            }
+        }
+    '''
+
+    def DRAIN_CELL_OUTPUT(webdriver, cell_element):
+        # one call: appended top-level output, whether an output iframe exists, run status, and dialog text.
+        # the observer is released once the run is complete.
+        return webdriver.execute_script(Colab._DEEP_JS + Colab._DRAIN_JS + '''
+            var cell = arguments[0];
+            var output = cell.querySelector('.output');
+            var button = cell.querySelector('colab-run-button');
+            var dialog = document.querySelector('paper-dialog');
+            var message = dialog ? deep(dialog, 'div') : null;
+            var state = {
+                text: output ? drain(output) : '',
+                iframe: output ? Boolean(output.querySelector('iframe')) : false,
+                complete: button ? Boolean(deep(button, '#status')) : false,
+                dialog: message ? message.innerText : null
+            };
+            if (state.complete) {
+                release(output);
+            }
+            return state;
+        ''', cell_element)
+
+    def DRAIN_CELL_OUTPUT_FRAME(webdriver, cell_element, complete = False):
+        # appended output inside the output iframe, if any, releasing its observer when complete.
+        # an iframe that colab replaces is observed afresh, so its whole text comes through again;
+        # OutputReader is the reader that continues across replacements.
+        try:
+            iframe = cell_element.find_element_by_class_name('output').find_element_by_tag_name('iframe')
+            webdriver.switch_to.default_content()
+            webdriver.switch_to.frame(iframe)
+            return webdriver.execute_script(Colab._DRAIN_JS + '''
+                var body = document.getElementById('output-body');
+                var text = body ? drain(body) : '';
+                if (arguments[0]) {
+                    release(body);
+                }
+                return text;
+            ''', complete)
+        except selenium.common.exceptions.WebDriverException:
+            # the iframe can be replaced between lookup and switch; the new one is drained next tick
+            return ''
+        finally:
+            webdriver.switch_to.default_content()
+
+    def RELEASE_CELL_OUTPUT(webdriver, cell_element):
+        # disconnects the observers of an observation that ended early
+        webdriver.execute_script(Colab._DRAIN_JS + '''
+            var output = arguments[0].querySelector('.output');
+            release(output);
+        ''', cell_element)
+        try:
+            iframe = cell_element.find_element_by_class_name('output').find_element_by_tag_name('iframe')
+            webdriver.switch_to.default_content()
+            webdriver.switch_to.frame(iframe)
+            webdriver.execute_script(Colab._DRAIN_JS + '''
+                release(document.getElementById('output-body'));
+            ''')
+        except selenium.common.exceptions.WebDriverException:
+            pass
+        finally:
+            webdriver.switch_to.default_content()
+
+    def OBSERVE_CELL_OUTPUT_TICK(webdriver, shadow, cell_element):
+        # returns (newly appended output, whether the run is complete)
+        state = Colab.DRAIN_CELL_OUTPUT(webdriver, cell_element)
+        chunk = state['text']
+        if state['iframe']:
+            chunk += Colab.DRAIN_CELL_OUTPUT_FRAME(webdriver, cell_element, state['complete'])
+        if state['dialog'] is not None:
+            Colab.CLOSE_DIALOG(webdriver, shadow)
+            chunk += state['dialog']
+        return chunk, state['complete']
+
+    def OBSERVE_CELL_OUTPUT(webdriver, shadow, cell_element, interval = 0.1):
+        # yields output chunks as they are appended, buffered in the page by MutationObservers
+        complete = False
+        try:
+            while not complete:
+                chunk, complete = Colab.OBSERVE_CELL_OUTPUT_TICK(webdriver, shadow, cell_element)
+                if chunk:
+                    yield chunk
+                if not complete:
+                    time.sleep(interval)
+        finally:
+            if not complete:
+                try:
+                    Colab.RELEASE_CELL_OUTPUT(webdriver, cell_element)
+                except selenium.common.exceptions.WebDriverException:
+                    pass
 
     def SET_CELL_TEXT(webdriver, cell_element, text):
+        try:
+            if Colab.PASTE_CELL_TEXT(webdriver, cell_element, text) == text:
+                return text
+        except selenium.common.exceptions.JavascriptException:
+            pass
+        return Colab.TYPE_CELL_TEXT(webdriver, cell_element, text)
+
+    def TYPE_CELL_TEXT(webdriver, cell_element, text):
         editor = cell_element.find_element_by_class_name('monaco-editor')
         editor.click()
         lines = cell_element.find_element_by_tag_name('textarea')
@@ -253,7 +1141,7 @@ class Colab:
         elems = shadow.find_elements(field_element, 'paper-item')
         for elem in elems:
             if str(elem.get_attribute('value')) == str(text):
-                WebDriverWait(webdriver, 10).until(lambda webdriver: elem.get_attribute('aria-disabled') != 'true')
+                Wait(webdriver, 'SET_FIELD_DROPDOWN_VALUE').until(lambda webdriver: elem.get_attribute('aria-disabled') != 'true')
                 shadow.find_element(field_element, 'input').clear()
                 shadow.find_element(field_element, 'input').send_keys(str(text))
                 #elem.click()
@@ -267,6 +1155,80 @@ class Colab:
         if bool(state) != Colab.GET_FIELD_CHECKBOX_VALUE(field_element):
             field_element.find_element_by_tag_name('input').click()
 
+    def GET_FIELD_VALUES(webdriver, cell_element):
+        # every field of the cell in one call, as a list of field() records
+        return webdriver.execute_script(Colab._DEEP_JS + Colab._FIELD_JS + '''
+            return Array.prototype.map.call(arguments[0].querySelectorAll('colab-form-input,colab-form-dropdown'), field);
+        ''', cell_element)
+
+    def SET_FIELD_VALUES(webdriver, cell_element, values):
+        # writes {name: value} into the cell's fields in one call and returns the fields as read back.
+        # names and options are all checked before anything is written.
+        result = webdriver.execute_script(Colab._DEEP_JS + Colab._FIELD_JS + '''
+            var values = arguments[1], errors = [], writes = [];
+            function type(input, text) {
+                input.value = text;
+                input.dispatchEvent(new Event('input', {bubbles: true, composed: true}));
+                input.dispatchEvent(new Event('change', {bubbles: true, composed: true}));
+            }
+            var elems = arguments[0].querySelectorAll('colab-form-input,colab-form-dropdown');
+            var fields = Array.prototype.map.call(elems, field);
+            var names = fields.map(record => record.name);
+            Object.keys(values).forEach(function(name) {
+                if (names.indexOf(name) < 0) {
+                    errors.push('no field named ' + name);
+                }
+            });
+            fields.forEach(function(record) {
+                if (!values.hasOwnProperty(record.name)) {
+                    return;
+                }
+                var value = values[record.name], elem = record.element;
+                if (record.type == 'INPUT') {
+                    writes.push(() => type(deep(elem, 'input'), String(value)));
+                } else if (record.type == 'CHECKBOX') {
+                    var input = elem.querySelector('input');
+                    writes.push(function() {
+                        if (input.checked != Boolean(value)) {
+                            input.click();
+                        }
+                    });
+                } else if (record.type == 'SELECT') {
+                    var select = elem.querySelector('select');
+                    var option = Array.prototype.find.call(select.options, option => option.text == String(value));
+                    if (!option) {
+                        errors.push('not an option: ' + String(value));
+                        return;
+                    }
+                    writes.push(function() {
+                        select.value = option.value;
+                        select.dispatchEvent(new Event('change', {bubbles: true}));
+                    });
+                } else if (record.type == 'DROPDOWN') {
+                    var items = [];
+                    (function collect(node) {
+                        items.push.apply(items, node.querySelectorAll('paper-item'));
+                        [node].concat(Array.from(node.querySelectorAll('*'))).forEach(child => child.shadowRoot && collect(child.shadowRoot));
+                    })(elem);
+                    if (!items.some(item => String(item.getAttribute('value')) == String(value))) {
+                        errors.push('not an option: ' + String(value));
+                        return;
+                    }
+                    writes.push(() => type(deep(elem, 'input'), String(value)));
+                } else {
+                    errors.push('unrecognised field ' + elem.tagName.toLowerCase());
+                }
+            });
+            if (errors.length) {
+                return {errors: errors, fields: fields};
+            }
+            writes.forEach(write => write());
+            return {errors: errors, fields: Array.prototype.map.call(elems, field)};
+        ''', cell_element, values)
+        if result['errors']:
+            raise Exception(', '.join(result['errors']))
+        return result['fields']
+
     def RESTART_RUNTIME(webdriver, shadow):
         webdriver.find_element_by_id('runtime-menu-button').click()
         webdriver.find_element_by_id('runtime-menu').find_element_by_xpath('//div[@command="restart"]').click()
@@ -276,11 +1238,20 @@ class Colab:
     def OPEN_DIALOG(webdriver):
         webdriver.find_element_by_id('file-menu-button').click()
         webdriver.find_element_by_id('file-menu').find_element_by_xpath('//div[@command="open"]').click()
+    def UPLOAD_NOTEBOOK(webdriver, path):
+        # opens an .ipynb file through the upload tab of the open dialog
+        Colab.OPEN_DIALOG(webdriver)
+        Wait(webdriver, 'UPLOAD_NOTEBOOK').until(lambda webdriver: webdriver.find_elements_by_css_selector('input[type=file]'))
+        webdriver.find_element_by_css_selector('input[type=file]').send_keys(path)
+    def DOWNLOAD_NOTEBOOK(webdriver):
+        webdriver.find_element_by_id('file-menu-button').click()
+        webdriver.find_element_by_id('file-menu').find_element_by_xpath('//div[@command="download-ipynb"]').click()
     def OPEN_DISMISS(webdriver):
         webdriver.find_element_by_class_name('dismiss').click()
 
     def DIALOG_MESSAGE(webdriver, shadow):
         try:
+            # the dialog itself is in the light dom; only its shadow children go through the cache
             dialog = webdriver.find_element_by_tag_name('paper-dialog')
             return shadow.find_element(dialog, 'div').text
         except:
@@ -291,7 +1262,10 @@ class Colab:
 
         # the aria-disabled attribute of the paper-button elements is 'false' when can be clicked, 'true' when unclickable
         dialog = webdriver.find_element_by_tag_name('paper-dialog')
-        WebDriverWait(webdriver, 10).until(lambda webdriver: shadow.find_element(dialog, 'paper-button').get_attribute('aria-disabled') != 'true')
+        Wait(webdriver, 'CLOSE_DIALOG').until_script(Colab._DEEP_JS + '''
+            var button = deep(arguments[0], 'paper-button');
+            return button && button.getAttribute('aria-disabled') != 'true';
+        ''', dialog)
 
         # click button
         try:
@@ -300,9 +1274,12 @@ class Colab:
             shadow.find_element(dialog, '.dismiss').click()
 
         # wait for dialog to go away
-        WebDriverWait(webdriver, 10).until(lambda webdriver: not Colab.DIALOG_MESSAGE(webdriver, shadow))
+        Wait(webdriver, 'CLOSE_DIALOG').until(lambda webdriver: not Colab.DIALOG_MESSAGE(webdriver, shadow))
             
-    def __init__(self, url = None, googledriver = None):
+    pool = None
+    def __init__(self, url = None, googledriver = None, timeouts = None):
+        # timeouts maps Wait operation names to seconds, overriding the GoogleDriver's
+        self.timeouts = dict(timeouts or {})
         if googledriver is None:
             import random
             engines = ['chrome', 'firefox']
@@ -318,76 +1295,365 @@ class Colab:
                 raise exception
         elif type(googledriver) is str:
             googledriver = GoogleDriver(googledriver)
+        elif isinstance(googledriver, GoogleDriverPool):
+            self.pool = googledriver
+            googledriver = self.pool.checkout()
         if url is None:
             url = Colab.BASEURL()
         self.googledriver = googledriver
         self.webdriver = googledriver.webdriver
-        self.shadow = Shadow(self.webdriver)
+        self.webdriver._clay_timeouts = collections.ChainMap(self.timeouts, googledriver.timeouts, Wait.TIMEOUTS)
+        self.shadow = self._shadow()
+        self._snapshot = None
+        self._cells = Colab.Cells(self)
         self.open(url)
     def reconnect(self):
-        self.googledriver.create()
+        if self.pool is not None:
+            self.pool.discard(self.googledriver)
+            self.googledriver = self.pool.checkout(self.googledriver.engine)
+        else:
+            self.googledriver.create()
         self.webdriver = self.googledriver.webdriver
+        self.webdriver._clay_timeouts = collections.ChainMap(self.timeouts, self.googledriver.timeouts, Wait.TIMEOUTS)
+        self.shadow = self._shadow()
         self.open(self.url)
+    def close(self):
+        # returns a pooled session to its pool
+        if self.pool is not None:
+            self.pool.checkin(self.googledriver)
+            self.pool = None
+    def _shadow(self):
+        # pyshadow is kept for debugging lookups without the cache
+        if ShadowCache.ENABLED:
+            shadow = ShadowCache(self.webdriver)
+        else:
+            from pyshadow.main import Shadow
+            shadow = Shadow(self.webdriver)
+        if self.googledriver.profiler is not None:
+            self.googledriver.profiler.attach_shadow(shadow)
+        return shadow
+    def _forget_page(self):
+        self.invalidate()
+        self._cells = Colab.Cells(self)
+        if isinstance(self.shadow, ShadowCache):
+            self.shadow.clear()
     def open(self, url):
+        self._forget_page()
         self.url = url
         self.webdriver.get(url)
         self._wait_for_loaded()
     def new(self):
+        self._forget_page()
         Colab.NEW_NOTEBOOK(self.webdriver)
-        self._wait_for_loaded()
+        self._wait_for_loaded(lambda: Colab.NEW_NOTEBOOK(self.webdriver))
         return self.name
+    def load_ipynb(self, notebook):
+        # notebook is a path to an .ipynb file, or nbformat data as a dict
+        if isinstance(notebook, dict):
+            with tempfile.NamedTemporaryFile('w', suffix = '.ipynb', delete = False) as file:
+                json.dump(notebook, file)
+            path = file.name
+        else:
+            path = notebook
+        try:
+            old_url = self.webdriver.current_url
+            self._forget_page()
+            Colab.UPLOAD_NOTEBOOK(self.webdriver, os.path.abspath(path))
+            Wait(self.webdriver, 'UPLOAD_NOTEBOOK').until(lambda webdriver: webdriver.current_url != old_url)
+            self._wait_for_loaded()
+            self.url = self.webdriver.current_url
+        finally:
+            if path is not notebook:
+                os.remove(path)
+        return self.name
+    def export_ipynb(self, timeout = None):
+        # downloads the notebook, returning its nbformat data including structured outputs
+        downloads = self.googledriver.downloads
+        before = set(os.listdir(downloads))
+        Colab.DOWNLOAD_NOTEBOOK(self.webdriver)
+        def downloaded(webdriver):
+            names = [name for name in os.listdir(downloads) if name not in before and name.endswith('.ipynb')]
+            return os.path.join(downloads, names[0]) if names else False
+        path = Wait(self.webdriver, 'DOWNLOAD_NOTEBOOK', timeout).until(downloaded)
+        # wait for the browser to finish writing it
+        def complete(webdriver):
+            try:
+                with open(path) as file:
+                    return json.load(file)
+            except ValueError:
+                return False
+        notebook = Wait(self.webdriver, 'DOWNLOAD_NOTEBOOK', timeout).until(complete)
+        os.remove(path)
+        return notebook
     def restart(self):
+        self.invalidate()
         Colab.RESTART_RUNTIME(self.webdriver, self.shadow)
     def insert_cell_below(self):
+        self.invalidate()
         Colab.INSERT_CELL_BELOW_CURRENT(self.webdriver)
+        self._cells.inserted()
+    def snapshot(self):
+        # cell properties read from the snapshot until invalidate() is called
+        records = Colab.SNAPSHOT_CELLS(self.webdriver)
+        self._snapshot = {
+            record['element'].id: record
+            for record in records
+        }
+        self._cells.update(records)
+        return records
+    def invalidate(self):
+        self._snapshot = None
     @property
     def cells(self):
-        return [
-            Colab.Cell(self, cell)
-            for cell in Colab.CELL_ELEMENTS(self.webdriver)
-        ]
+        return self._cells
     @property
     def name(self):
         return Colab.GET_NOTEBOOK_NAME(self.webdriver)
     @name.setter
     def doc_name(self, name):
         Colab.SET_NOTEBOOK_NAME(self.webdriver, name)
-    def _wait_for_loaded(self):
-        WebDriverWait(self.webdriver, 10).until(Colab.CONDITIONS_NOTEBOOK_LOADED())
+    def _wait_for_loaded(self, reload = None):
+        googledriver = self.googledriver
+        def loaded_or_signin(webdriver):
+            return bool(webdriver.find_elements_by_id('doc-name')) or googledriver.is_signin_url(webdriver.current_url)
+        Wait(self.webdriver, 'NOTEBOOK_LOADED').until(loaded_or_signin)
+        if not self.webdriver.find_elements_by_id('doc-name'):
+            # redirected to sign in: the cached login was stale.  verify() raises if not logged in.
+            googledriver.forget_login()
+            googledriver.verify()
+            if reload is None:
+                self.webdriver.get(self.url)
+            else:
+                reload()
+            Wait(self.webdriver, 'NOTEBOOK_LOADED').until(Colab.CONDITIONS_NOTEBOOK_LOADED())
+
+    class OutputReader:
+        # reads a cell's output incrementally.  each read() returns only what was added since the last
+        # one, from the static output or from every output iframe, with one script per frame.  how far
+        # each output slot has been read is kept here, so an iframe that colab replaces with one
+        # repeating the earlier output is read on from where the old one left off, and a frame that
+        # can't be read this time is read in full next time.
+        def __init__(self, webdriver, cell_element):
+            self.webdriver = webdriver
+            self.cell_element = cell_element
+            self.slots = {}
+        def _read(self, slot, script, *params):
+            offset, tail = self.slots.get(slot, (0, ''))
+            result = self.webdriver.execute_script(Colab._READ_JS + script, offset, tail, *params)
+            self.slots[slot] = (result['offset'], result['tail'])
+            return result['chunk']
+        def read(self):
+            self.webdriver.switch_to.default_content()
+            iframes = self.webdriver.execute_script('''
+                var output = arguments[0].querySelector('.output');
+                return output ? Array.prototype.slice.call(output.getElementsByTagName('iframe')) : [];
+            ''', self.cell_element)
+            if not iframes:
+                return self._read('static', '''
+                    var output = arguments[2].querySelector('.output');
+                    return read(output && (output.querySelector('colab-static-output-renderer') || output), arguments[0], arguments[1]);
+                ''', self.cell_element)
+            chunks = []
+            try:
+                for index, iframe in enumerate(iframes):
+                    try:
+                        self.webdriver.switch_to.default_content()
+                        self.webdriver.switch_to.frame(iframe)
+                        chunks.append(self._read(index, '''
+                            return read(document.getElementById('output-body'), arguments[0], arguments[1]);
+                        '''))
+                    except selenium.common.exceptions.WebDriverException:
+                        # removed since listed, or while being read; its slot is left as it was,
+                        # and a replacement is picked up next read
+                        continue
+            finally:
+                self.webdriver.switch_to.default_content()
+            return ''.join(chunks)
+
+    class Cells(collections.abc.Sequence):
+        # a lazy view of the notebook's cells.  one Cell wrapper is kept per Colab cell id, and
+        # insertions made through Colab update the id order in place instead of rescanning.
+        # the order is rescanned when the page's cell count no longer matches it, as when cells
+        # are added or deleted by other means.
+        def __init__(self, colab):
+            self.colab = colab
+            self._wrappers = {}
+            self._order = None
+        def _ids(self):
+            if self._order is not None and Colab.CELL_COUNT(self.colab.webdriver) != len(self._order):
+                self._order = None
+            if self._order is None:
+                ids = Colab.CELL_IDS(self.colab.webdriver)
+                if not all(ids):
+                    # cells without ids can't be tracked
+                    return None
+                self._order = ids
+                self._wrappers = {
+                    id: wrapper
+                    for id, wrapper in self._wrappers.items()
+                    if id in ids
+                }
+            return self._order
+        def _wrap(self, ids):
+            missing = [id for id in ids if id not in self._wrappers]
+            if missing:
+                elements = Colab.CELL_ELEMENTS_BY_ID(self.colab.webdriver, missing)
+                if None in elements:
+                    # a cell was removed outside this view
+                    self.refresh()
+                    raise IndexError('cell removed from notebook')
+                for id, element in zip(missing, elements):
+                    self._wrappers[id] = Colab.Cell(self.colab, element, id)
+            return [self._wrappers[id] for id in ids]
+        def __len__(self):
+            ids = self._ids()
+            if ids is None:
+                return len(Colab.CELL_ELEMENTS(self.colab.webdriver))
+            return len(ids)
+        def __getitem__(self, index):
+            ids = self._ids()
+            if ids is None:
+                return [
+                    Colab.Cell(self.colab, cell)
+                    for cell in Colab.CELL_ELEMENTS(self.colab.webdriver)
+                ][index]
+            if isinstance(index, slice):
+                return self._wrap(ids[index])
+            return self._wrap([ids[index]])[0]
+        def __iter__(self):
+            return iter(self[:])
+        def inserted(self):
+            if self._order is None:
+                return
+            focused = Colab.FOCUSED_CELL(self.colab.webdriver)
+            if focused is None or not focused['id'] or focused['id'] in self._order:
+                self._order = None
+                return
+            self._order.insert(focused['index'], focused['id'])
+            self._wrappers[focused['id']] = Colab.Cell(self.colab, focused['element'], focused['id'])
+        def update(self, records):
+            # takes the order and elements from a snapshot
+            if not all((record['id'] for record in records)):
+                self._order = None
+                return
+            self._order = [record['id'] for record in records]
+            for record in records:
+                wrapper = self._wrappers.get(record['id'])
+                if wrapper is None:
+                    self._wrappers[record['id']] = Colab.Cell(self.colab, record['element'], record['id'])
+                else:
+                    wrapper.element = record['element']
+        def refresh(self):
+            self._order = None
 
     class Cell:
-        def __init__(self, colab, element):
+        def __init__(self, colab, element, id = None):
             self.colab = colab
             self.element = element
+            self.id = id
+            self._image_digests = set()
+            self._reader = None
+        def _record(self):
+            if self.colab._snapshot is None:
+                return None
+            return self.colab._snapshot.get(self.element.id)
         def run(self):
+            self.colab.invalidate()
+            # a new run's output is read from its start
+            self._reader = None
             Colab.RUN_CELL(self.colab.webdriver, self.colab.shadow, self.element)
             if Colab.DIALOG_MESSAGE(self.colab.webdriver, self.colab.shadow):
                 Colab.CLOSE_DIALOG(self.colab.webdriver, self.colab.shadow)
             return self.stream
         @property
         def text(self):
+            record = self._record()
+            if record is not None and record['text'] is not None:
+                return record['text']
             return Colab.GET_CELL_TEXT(self.element)
         @property
         def fields(self):
+            record = self._record()
+            if record is not None and all((field['type'] for field in record['fields'])):
+                return [
+                    getattr(Colab.Cell, field['type'].title() + 'Field')(self, field['element'])
+                    for field in record['fields']
+                ]
             return [
                 getattr(Colab.Cell, Colab.GET_FIELD_TYPE(element).title() + 'Field')(self, element)
                 for element in Colab.FIELD_ELEMENTS(self.element)
             ]
+        def get_fields(self):
+            return {
+                field['name']: field['value']
+                for field in Colab.GET_FIELD_VALUES(self.colab.webdriver, self.element)
+            }
+        def set_fields(self, values):
+            self.colab.invalidate()
+            fields = Colab.SET_FIELD_VALUES(self.colab.webdriver, self.element, values)
+            # fields the page did not accept from script are set the slow way
+            for field in fields:
+                if field['name'] not in values:
+                    continue
+                value = values[field['name']]
+                if field['type'] == 'CHECKBOX':
+                    accepted = field['value'] == bool(value)
+                else:
+                    accepted = str(field['value']) == str(value)
+                if not accepted:
+                    getattr(Colab.Cell, field['type'].title() + 'Field')(self, field['element']).value = value
         @text.setter
         def text(self, text):
+            self.colab.invalidate()
             return Colab.SET_CELL_TEXT(self.colab.webdriver, self.element, text)
         @property
         def output(self):
+            record = self._record()
+            if record is not None and record['output'] is not None:
+                return record['output']
             return Colab.GET_CELL_OUTPUT(self.colab.webdriver, self.element)
         @property
         def imgs(self):
+            record = self._record()
+            if record is not None and record['imgs'] is not None:
+                return record['imgs']
             return Colab.GET_CELL_IMGS(self.colab.webdriver, self.element)
+        def images(self, directory = None):
+            # yields (digest, mime, data) once per distinct output image, data being a memoryview of the
+            # decoded bytes.  images this Cell has yielded before are not transferred again, and images
+            # the page can't read are skipped.
+            # with directory, each image is also written there, named by its digest.
+            for image in Colab.GET_CELL_IMAGES(self.colab.webdriver, self.element, self._image_digests):
+                if 'payload' not in image or image['digest'] in self._image_digests:
+                    continue
+                self._image_digests.add(image['digest'])
+                if image['base64']:
+                    data = base64.b64decode(image['payload'])
+                else:
+                    data = urllib.parse.unquote_to_bytes(image['payload'])
+                if directory is not None:
+                    extension = mimetypes.guess_extension(image['mime']) or ''
+                    with open(os.path.join(directory, image['digest'] + extension), 'wb') as file:
+                        file.write(data)
+                yield image['digest'], image['mime'], memoryview(data)
         @property
         def stream(self):
             return Colab.GENERATE_CELL_OUTPUT(self.colab.webdriver, self.colab.shadow, self.element)
+        def read_output(self):
+            # the output added since the last read_output()
+            if self._reader is None:
+                self._reader = Colab.OutputReader(self.colab.webdriver, self.element)
+            return self._reader.read()
+        def observe(self, interval = 0.1):
+            # output chunks as they are appended.  if colab replaces the output iframe mid-run, the
+            # replacement's whole text is yielded again; stream and read_output do not repeat it.
+            return Colab.OBSERVE_CELL_OUTPUT(self.colab.webdriver, self.colab.shadow, self.element, interval)
 
         @property
         def is_run_complete(self):
+            record = self._record()
+            if record is not None and record['complete'] is not None:
+                return record['complete']
             return Colab.IS_RUN_COMPLETE(self.colab.webdriver, self.colab.shadow, self.element)
 
         def __str__(self):
@@ -405,7 +1671,22 @@ class Colab:
                 self.element = element
             @property
             def name(self):
+                record = self._record()
+                if record is not None:
+                    return record['name']
                 return Colab.GET_FIELD_NAME(self.element)
+            def _record(self):
+                record = self.cell._record()
+                if record is not None:
+                    for field in record['fields']:
+                        if field['element'] == self.element:
+                            return field
+                return None
+            def _cached_value(self, getter, *params):
+                record = self._record()
+                if record is not None and record['value'] is not None:
+                    return record['value']
+                return getter(*params)
             def __str__(self):
                 return self.name + ': ' + str(self.value)
             def __repr__(self):
@@ -414,9 +1695,10 @@ class Colab:
         class InputField(Field):
             @property
             def value(self):
-                return Colab.GET_FIELD_INPUT_VALUE(self.cell.colab.shadow, self.element)
+                return self._cached_value(Colab.GET_FIELD_INPUT_VALUE, self.cell.colab.shadow, self.element)
             @value.setter
             def value(self, text):
+                self.cell.colab.invalidate()
                 return Colab.SET_FIELD_INPUT_VALUE(self.cell.colab.shadow, self.element, text)
 
         class SelectField(Field):
@@ -425,9 +1707,10 @@ class Colab:
                 return Colab.GET_FIELD_SELECT_OPTIONS(self.element)
             @property
             def value(self):
-                return Colab.GET_FIELD_SELECT_VALUE(self.element)
+                return self._cached_value(Colab.GET_FIELD_SELECT_VALUE, self.element)
             @value.setter
             def value(self, text):
+                self.cell.colab.invalidate()
                 return Colab.SET_FIELD_SELECT_VALUE(self.element, text)
 
         class DropdownField(Field):
@@ -436,15 +1719,447 @@ class Colab:
                 return Colab.GET_FIELD_DROPDOWN_OPTIONS(self.cell.colab.webdriver, self.cell.colab.shadow, self.element)
             @property
             def value(self):
-                return Colab.GET_FIELD_DROPDOWN_VALUE(self.cell.colab.webdriver, self.cell.colab.shadow, self.element)
+                return self._cached_value(Colab.GET_FIELD_DROPDOWN_VALUE, self.cell.colab.webdriver, self.cell.colab.shadow, self.element)
             @value.setter
             def value(self, text):
+                self.cell.colab.invalidate()
                 return Colab.SET_FIELD_DROPDOWN_VALUE(self.cell.colab.webdriver, self.cell.colab.shadow, self.element, text)
 
         class CheckboxField(Field):
             @property
             def value(self):
-                return Colab.GET_FIELD_CHECKBOX_VALUE(self.element)
+                return self._cached_value(Colab.GET_FIELD_CHECKBOX_VALUE, self.element)
             @value.setter
             def value(self, state : bool):
+                self.cell.colab.invalidate()
                 Colab.SET_FIELD_CHECKBOX_VALUE(self.element, state)
+
+class Profiler:
+    # opt-in tracing of webdriver round trips.  while started, Colab's helper functions and
+    # Wait.until are wrapped in spans, and the commands and shadow lookups of attached
+    # webdrivers are recorded under the innermost span of their thread.  use as:
+    #   profiler = Profiler(colab)
+    #   with profiler:
+    #       ...
+    #   profiler.summary(), profiler.to_json(), profiler.to_otel()
+    # attached webdrivers pass commands straight through while the profiler is stopped;
+    # detach() removes the wrappers altogether.
+    BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30, 60, float('inf')]
+    _started = None
+    def __init__(self, *targets):
+        self.spans = []
+        self.trace_id = uuid.uuid4().hex
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._patches = []
+        self._wrappers = []
+        self._googledrivers = []
+        for target in targets:
+            self.attach(target)
+    def attach(self, target):
+        # target is a Colab, GoogleDriver or webdriver.  GoogleDrivers reattach when they recreate their webdriver.
+        if isinstance(target, Colab):
+            self.attach_shadow(target.shadow)
+            target = target.googledriver
+        if isinstance(target, GoogleDriver):
+            target.profiler = self
+            self._googledrivers.append(target)
+            target = target.webdriver
+        if getattr(target, '_clay_profiler', None) is self:
+            return
+        execute = target.execute
+        def profiled(command, params = None):
+            if Profiler._started is not self:
+                return execute(command, params)
+            with self.trace(command, 'command'):
+                return execute(command, params)
+        self._wrap(target, 'execute', profiled)
+        target._clay_profiler = self
+    def attach_shadow(self, shadow):
+        for name in ('find_element', 'find_elements'):
+            lookup = getattr(shadow, name)
+            def profiled(*params, name = name, lookup = lookup):
+                if Profiler._started is not self:
+                    return lookup(*params)
+                with self.trace('shadow.' + name, 'shadow', selector = params[-1]):
+                    return lookup(*params)
+            self._wrap(shadow, name, profiled)
+    def _wrap(self, target, name, wrapper):
+        self._wrappers.append((target, name, vars(target).get(name), wrapper))
+        setattr(target, name, wrapper)
+    def detach(self):
+        # removes this profiler's wrappers from everything it was attached to
+        if Profiler._started is self:
+            self.stop()
+        for target, name, original, wrapper in reversed(self._wrappers):
+            if vars(target).get(name) is not wrapper:
+                # wrapped again since; the wrapper stays, passing calls through
+                continue
+            if original is None:
+                delattr(target, name)
+            else:
+                setattr(target, name, original)
+            if vars(target).get('_clay_profiler') is self:
+                del target._clay_profiler
+        self._wrappers = []
+        for googledriver in self._googledrivers:
+            if googledriver.profiler is self:
+                googledriver.profiler = None
+        self._googledrivers = []
+    def start(self):
+        if Profiler._started is not None:
+            raise Exception('another Profiler is already started')
+        Profiler._started = self
+        for name, value in list(vars(Colab).items()):
+            if name.isupper() and callable(value):
+                self._patch(Colab, name, self._operation(name, value))
+        until = Wait.until
+        def profiled_until(wait, method, message = ''):
+            def poll(webdriver):
+                with self.trace(getattr(method, '__name__', 'condition'), 'poll'):
+                    return method(webdriver)
+            with self.trace('Wait.until', 'wait', operation = wait.operation, timeout = wait.timeout):
+                return until(wait, poll, message)
+        self._patch(Wait, 'until', profiled_until)
+        return self
+    def stop(self):
+        for owner, name, value in reversed(self._patches):
+            setattr(owner, name, value)
+        self._patches = []
+        Profiler._started = None
+    def __enter__(self):
+        return self.start()
+    def __exit__(self, *exc_info):
+        self.stop()
+    def _patch(self, owner, name, replacement):
+        self._patches.append((owner, name, vars(owner)[name]))
+        setattr(owner, name, replacement)
+    def _operation(self, name, func):
+        import inspect
+        if inspect.isgeneratorfunction(func):
+            # one span from the call until the generator is exhausted or closed, current only while
+            # the generator runs, so the work of each next() is attributed to it
+            def profiled_generator(*params, **kwparams):
+                span = self._span(name, 'operation', {})
+                try:
+                    generator = func(*params, **kwparams)
+                    try:
+                        while True:
+                            with self._current(span):
+                                try:
+                                    value = next(generator)
+                                except StopIteration:
+                                    return
+                            yield value
+                    finally:
+                        generator.close()
+                finally:
+                    self._finish(span)
+            return profiled_generator
+        def profiled(*params, **kwparams):
+            with self.trace(name, 'operation'):
+                return func(*params, **kwparams)
+        return profiled
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+    def _span(self, name, kind, attributes):
+        stack = self._stack()
+        return {
+            'id': next(self._ids),
+            'parent': stack[-1]['id'] if stack else None,
+            'name': name,
+            'kind': kind,
+            'thread': threading.get_ident(),
+            'start': time.time(),
+            'end': None,
+            'attributes': attributes,
+        }
+    @contextlib.contextmanager
+    def _current(self, span):
+        # makes span the parent of spans started within
+        stack = self._stack()
+        stack.append(span)
+        try:
+            yield span
+        except Exception as exception:
+            span['attributes']['error'] = repr(exception)
+            raise
+        finally:
+            stack.pop()
+    def _finish(self, span):
+        span['end'] = time.time()
+        with self._lock:
+            self.spans.append(span)
+    @contextlib.contextmanager
+    def trace(self, name, kind = 'span', **attributes):
+        span = self._span(name, kind, attributes)
+        try:
+            with self._current(span):
+                yield span
+        finally:
+            self._finish(span)
+    def summary(self):
+        # per operation: calls, inclusive seconds, a latency histogram over BUCKETS, and the commands,
+        # shadow lookups and wait polls made directly within it rather than in a nested operation
+        with self._lock:
+            spans = list(self.spans)
+        by_id = {span['id']: span for span in spans}
+        operations = {}
+        def operation(name):
+            return operations.setdefault(name, {'calls': 0, 'seconds': 0.0, 'histogram': [0] * len(Profiler.BUCKETS), 'command': 0, 'shadow': 0, 'poll': 0})
+        for span in spans:
+            if span['kind'] == 'operation':
+                stats = operation(span['name'])
+                seconds = span['end'] - span['start']
+                stats['calls'] += 1
+                stats['seconds'] += seconds
+                stats['histogram'][bisect.bisect_left(Profiler.BUCKETS, seconds)] += 1
+            elif span['kind'] in ('command', 'shadow', 'poll'):
+                parent = by_id.get(span['parent'])
+                while parent is not None and parent['kind'] != 'operation':
+                    parent = by_id.get(parent['parent'])
+                operation(parent['name'] if parent is not None else None)[span['kind']] += 1
+        return operations
+    def to_json(self):
+        with self._lock:
+            spans = list(self.spans)
+        return json.dumps({'buckets': Profiler.BUCKETS[:-1], 'spans': spans, 'summary': {str(name): stats for name, stats in self.summary().items()}}, default = repr)
+    def to_otel(self):
+        # the spans in the shape of OpenTelemetry's JSON span encoding
+        with self._lock:
+            spans = list(self.spans)
+        return [
+            {
+                'traceId': self.trace_id,
+                'spanId': '%016x' % span['id'],
+                'parentSpanId': '' if span['parent'] is None else '%016x' % span['parent'],
+                'name': span['name'],
+                'kind': 'SPAN_KIND_INTERNAL',
+                'startTimeUnixNano': int(span['start'] * 1e9),
+                'endTimeUnixNano': int(span['end'] * 1e9),
+                'attributes': [
+                    {'key': 'clay.' + key, 'value': {'stringValue': str(value)}}
+                    for key, value in dict(span['attributes'], kind = span['kind'], thread = span['thread']).items()
+                ],
+                'status': {'code': 'STATUS_CODE_ERROR' if 'error' in span['attributes'] else 'STATUS_CODE_OK'},
+            }
+            for span in spans
+        ]
+
+class ColabBatch:
+    # runs one notebook once per dict of form field values, across a bounded number of sessions,
+    # yielding {'index', 'params', 'outputs', 'error'} for each run as it completes.
+    # googledriver is a GoogleDriverPool, or a GoogleDriver whose browser then hosts each session
+    # in its own tab.  without one, a pool is started for the batch and closed when it ends.
+    # sessions opened on one notebook would share its runtime, so without copies the runs are made
+    # one at a time in a single session.  with copies, each run uploads its own copy of the notebook
+    # with load_ipynb and gets its own runtime; colab saves every upload as a new notebook in the
+    # user's drive, and they are not deleted.
+    def __init__(self, url, params, googledriver = None, sessions = 2, retries = 1, copies = False):
+        self.url = url
+        self.params = list(params)
+        self.googledriver = googledriver
+        self.sessions = sessions
+        self.retries = retries
+        self.copies = copies
+    def __iter__(self):
+        sessions = min(self.sessions if self.copies else 1, len(self.params))
+        googledriver = self.googledriver
+        pool = None
+        if googledriver is None:
+            googledriver = pool = GoogleDriverPool(sessions)
+        jobs = queue.Queue()
+        for index, params in enumerate(self.params):
+            jobs.put((index, params))
+        results = queue.Queue()
+        stopped = threading.Event()
+        template = None
+        template_lock = threading.Lock()
+        def work():
+            nonlocal template
+            if isinstance(googledriver, GoogleDriverPool):
+                session = googledriver
+            else:
+                # commands from separate tabs are serialized by their host
+                session = googledriver.tab()
+            try:
+                colab = Colab(self.url, session)
+            except Exception as exception:
+                # this session is lost; the others take its jobs
+                if session is not googledriver:
+                    session.quit()
+                results.put(exception)
+                return
+            failure = None
+            try:
+                if self.copies:
+                    with template_lock:
+                        if template is None:
+                            template = colab.export_ipynb()
+                while not stopped.is_set():
+                    try:
+                        index, params = jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    try:
+                        results.put(self._run(colab, template, index, params))
+                    except:
+                        # the session could not be recovered; leave the job for another
+                        jobs.put((index, params))
+                        raise
+            except Exception as exception:
+                failure = exception
+            colab.close()
+            if session is not googledriver:
+                session.quit()
+            results.put(failure)
+        threads = [threading.Thread(target = work, daemon = True) for index in range(sessions)]
+        try:
+            for thread in threads:
+                thread.start()
+            running = len(threads)
+            failure = None
+            while running:
+                result = results.get()
+                if result is None or isinstance(result, Exception):
+                    running -= 1
+                    failure = result if result is not None else failure
+                    continue
+                yield result
+            if not jobs.empty():
+                raise failure if failure is not None else Exception('no session could run the remaining jobs')
+        finally:
+            # when iteration stops early, workers finish their current run and then shut down
+            stopped.set()
+            if pool is not None:
+                pool.close()
+    def run(self):
+        return sorted(self, key = lambda result: result['index'])
+    def _run(self, colab, template, index, params):
+        error = None
+        copy = None
+        for attempt in range(self.retries + 1):
+            try:
+                if template is None:
+                    colab.open(self.url)
+                elif copy is None:
+                    colab.load_ipynb(template)
+                    copy = colab.url
+                else:
+                    # retries reuse this run's copy rather than uploading another
+                    colab.open(copy)
+                return {'index': index, 'params': params, 'outputs': ColabBatch.RUN(colab, params), 'error': None}
+            except Exception as exception:
+                error = exception
+                # recover the session for the next attempt or job
+                try:
+                    colab.restart()
+                except Exception:
+                    colab.reconnect()
+        return {'index': index, 'params': params, 'outputs': None, 'error': error}
+    def RUN(colab, params):
+        # sets the fields named in params wherever they are, then runs every code cell, returning their outputs
+        remaining = dict(params)
+        outputs = []
+        for cell in colab.cells:
+            names = cell.get_fields().keys()
+            values = {name: remaining.pop(name) for name in list(remaining) if name in names}
+            if values:
+                cell.set_fields(values)
+        if remaining:
+            raise Exception('no field named ' + ', '.join(remaining))
+        for cell in colab.cells:
+            if not Colab.IS_CODE_CELL(cell.element):
+                continue
+            cell.run()
+            outputs.append(''.join(cell.observe()))
+        return outputs
+
+class AsyncColab:
+    # runs Colab's blocking calls on a worker thread per notebook, so calls to one
+    # notebook stay serialized while many notebooks proceed concurrently on one loop
+    def __init__(self, colab, executor = None):
+        if executor is None:
+            import concurrent.futures
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+        self.colab = colab
+        self.executor = executor
+    @classmethod
+    async def create(cls, url = None, googledriver = None):
+        import asyncio
+        import concurrent.futures
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+        colab = await asyncio.get_running_loop().run_in_executor(executor, Colab, url, googledriver)
+        return cls(colab, executor)
+    async def _call(self, func, *params):
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *params)
+    async def reconnect(self):
+        await self._call(self.colab.reconnect)
+    async def open(self, url):
+        await self._call(self.colab.open, url)
+    async def new(self):
+        return await self._call(self.colab.new)
+    async def restart(self):
+        await self._call(self.colab.restart)
+    async def insert_cell_below(self):
+        await self._call(self.colab.insert_cell_below)
+    async def snapshot(self):
+        return await self._call(self.colab.snapshot)
+    async def cells(self):
+        cells = await self._call(lambda: list(self.colab.cells))
+        return [AsyncCell(self, cell) for cell in cells]
+    async def name(self):
+        return await self._call(lambda: self.colab.name)
+    def close(self):
+        # returns a pooled session to its pool once the calls queued before it have run
+        self.executor.submit(self.colab.close)
+        self.executor.shutdown(wait = False)
+
+class AsyncCell:
+    def __init__(self, colab, cell):
+        self.colab = colab
+        self.cell = cell
+    async def run(self):
+        await self.colab._call(self.cell.run)
+        return self.stream()
+    async def text(self):
+        return await self.colab._call(lambda: self.cell.text)
+    async def set_text(self, text):
+        return await self.colab._call(setattr, self.cell, 'text', text)
+    async def output(self):
+        return await self.colab._call(lambda: self.cell.output)
+    async def imgs(self):
+        return await self.colab._call(lambda: self.cell.imgs)
+    async def images(self, directory = None):
+        return await self.colab._call(lambda: list(self.cell.images(directory)))
+    async def get_fields(self):
+        return await self.colab._call(self.cell.get_fields)
+    async def set_fields(self, values):
+        await self.colab._call(self.cell.set_fields, values)
+    async def is_run_complete(self):
+        return await self.colab._call(lambda: self.cell.is_run_complete)
+    async def stream(self, interval = 0.1):
+        import asyncio
+        # the worker thread is only held for each drain, not between ticks
+        colab = self.cell.colab
+        complete = False
+        try:
+            while not complete:
+                chunk, complete = await self.colab._call(Colab.OBSERVE_CELL_OUTPUT_TICK, colab.webdriver, colab.shadow, self.cell.element)
+                if chunk:
+                    yield chunk
+                if not complete:
+                    await asyncio.sleep(interval)
+        finally:
+            if not complete:
+                # disconnect the page's observers without waiting on them
+                try:
+                    self.colab.executor.submit(Colab.RELEASE_CELL_OUTPUT, colab.webdriver, self.cell.element)
+                except RuntimeError:
+                    # the AsyncColab was closed
+                    pass